@@ -3,6 +3,7 @@ import json
 import requests
 import os
 import datetime
+import time
 
 import training_schedule
 
@@ -13,7 +14,7 @@ class Bot:
     API_URL = "https://api.groupme.com/v3"
 
 
-    def __init__(self, token: str, user_id: str, group_id: str, id: str, logger: object):
+    def __init__(self, token: str, user_id: str, group_id: str, id: str, logger: object, archive: object = None):
         """
         Parameters:
 
@@ -22,6 +23,7 @@ class Bot:
         group_id -> The GroupMe groupid that this bot chat too
         id -> The GroupMe botid identifying which bot to use
         logger -> Logging object used to create log messages
+        archive -> MessageArchive used to search through the group chat's message history
         """
 
         self.token = token
@@ -30,6 +32,7 @@ class Bot:
         self.id = id
 
         self.log = logger
+        self.archive = archive
 
     
     @property
@@ -56,6 +59,7 @@ class Bot:
             "$schedule clear": self.schedule_clear,
             "$smsgs on": self.smsgs_on,
             "$smsgs off": self.smsgs_off,
+            "$search": self.search,
         }
 
         return admin_commands
@@ -241,7 +245,7 @@ class Bot:
         self.post("Successfully cleared training schedule.")
 
     async def smsgs_on(self):
-        """Activates scheduled reminders to be posted within the chat every (Mon., Wed., and Fri.) for coaches to update their tracker (This is turned on by default when the bot comes online)."""
+        """Activates scheduled reminders to be posted within the chat every (Mon., Wed., and Fri.) for coaches to update their tracker (This is turned on by default when the bot comes online, unless it was turned off before a handoff restart)."""
         # Note: Scheduled messages of reminders for coaches to update their tracker will be set to occur every Mon., Wed., and Fri. at 8PM EST.
 
         self.log.info("Scheduled messages was turned on")
@@ -309,3 +313,42 @@ class Bot:
                 return
         
         self.post("Scheduled messages have already been turned off")
+
+
+    def search(self, terms: str = ""):
+        """Searches the group chat's message history for messages containing all of the given terms (ie. $search tracker update)."""
+
+        if self.archive is None:
+            self.post("Message search is unavailable")
+            return
+        
+        if not terms.strip():
+            self.post("Usage: $search <terms>")
+            return
+
+        # Time the query so slow searches show up in the logs
+        start = time.perf_counter()
+        results = self.archive.search(terms, group_id=self.group_id)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        self.log.info(f"[ $search ] command ran ({len(results)} results in {elapsed_ms:.1f} ms)")
+
+        if not results:
+            self.post(f"No messages found for: {terms}")
+            return
+
+        MAX_MSG_LEN = 1000
+        message = f"\U0001F50E Results for: {terms}"
+
+        for name, text, created_at in results:
+            sent = datetime.datetime.fromtimestamp(created_at).strftime("%m/%d/%Y %I:%M %p")
+            result = f"\n\n{name} ({sent}):\n{text}"
+
+            # Stop adding results once the post would go over the message limit
+            if len(message) + len(result) > MAX_MSG_LEN:
+                break
+
+            message += result
+
+        # Post search results
+        self.post(message)
@@ -0,0 +1,194 @@
+import asyncio
+import fcntl
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+
+
+
+# Files used to hand state over between the running process and its successor
+PID_FILE = "./Logs/wocc_bot.pid"
+CHECKPOINT_FILE = "./Logs/checkpoint.json"
+
+HANDOFF_TIMEOUT = 60 # Seconds a successor waits to subscribe, and before warning that the old process is slow to exit
+
+successor = None # Popen of the successor process spawned on SIGHUP
+pid_file = None # The pid file, kept open and locked while this process is handling the group chat
+
+
+
+def install_signal_handlers(request_shutdown, logger: object) -> None:
+    """
+    Makes SIGTERM shut the bot down gracefully, and SIGHUP start a successor process in handoff mode.
+
+    request_shutdown -> Callable that tells the main loop to stop intake and drain
+    logger -> Logging object used to create log messages
+    """
+
+    loop = asyncio.get_running_loop()
+
+    loop.add_signal_handler(signal.SIGTERM, request_shutdown)
+    loop.add_signal_handler(signal.SIGINT, request_shutdown)
+    loop.add_signal_handler(signal.SIGHUP, spawn_successor, logger)
+
+
+def spawn_successor(logger: object) -> None:
+    """
+    Starts a new bot process in handoff mode. Once it has warmed up it will SIGTERM this process,
+    so the code on disk can be reloaded without missing any commands.
+
+    NOTE: The successor is a child of this process, so this only works when the bot is run bare.
+          Under a supervisor (ie. systemd or as a container's PID 1) it would be torn down along with this process,
+          so there the supervisor should start the new process with --handoff itself.
+    """
+
+    global successor
+
+    # Only allow one handoff at a time
+    if successor is not None and successor.poll() is None:
+        logger.warning("Handoff already in progress, ignoring SIGHUP")
+        return
+
+    successor = subprocess.Popen(
+        [sys.executable, os.path.abspath(sys.argv[0]), "--handoff"],
+        cwd=os.getcwd(),
+        start_new_session=True,
+    )
+    logger.info(f"Started successor process {successor.pid} in handoff mode")
+
+
+async def retire_predecessor(logger: object) -> bool:
+    """
+    Sends SIGTERM to the running bot and waits for it to finish its graceful shutdown, then takes over the pid file lock.
+
+    The predecessor only releases the lock after writing its checkpoint, so once the lock is taken the checkpoint is ready to be loaded.
+    This waits for as long as the predecessor takes, since taking over while it still runs would answer commands twice.
+
+    Returns False if the predecessor could not be signalled, leaving it in charge.
+    """
+
+    # A held lock means the pid belongs to a running bot, which writes its pid right after locking
+    pid = None
+    while pid is None:
+        if lock_pid():
+            logger.info("No running predecessor found to hand off from")
+            return True
+
+        pid = read_pid()
+        if pid is None:
+            await asyncio.sleep(0.1)
+
+    try:
+        os.kill(pid, signal.SIGTERM)
+    except (ProcessLookupError, PermissionError):
+        logger.critical(f"Failed to signal predecessor process {pid}, is it in another PID namespace?")
+        return False
+
+    logger.info(f"Sent SIGTERM to predecessor process {pid}, waiting for it to drain")
+
+    deadline = time.monotonic() + HANDOFF_TIMEOUT
+    warned = False
+    while not lock_pid():
+        if not warned and time.monotonic() > deadline:
+            logger.warning(f"Predecessor process {pid} is still draining after {HANDOFF_TIMEOUT} seconds, still waiting")
+            warned = True
+
+        await asyncio.sleep(0.1)
+
+    logger.info(f"Predecessor process {pid} exited, taking over")
+    return True
+
+
+def read_pid() -> int:
+    """Returns the pid found in the pid file, or None if there isn't one."""
+
+    try:
+        with open(PID_FILE, "r") as file:
+            return int(file.read().strip())
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def lock_pid() -> bool:
+    """
+    Marks this process as the one currently handling the group chat by locking the pid file and writing its pid to it.
+    The lock is held until unlock_pid() or until the process dies, so a pid file left behind by a crash is never mistaken for a running bot.
+
+    Returns False if another running bot already holds the lock.
+    """
+
+    global pid_file
+
+    if pid_file is not None:
+        return True
+
+    file = open(PID_FILE, "a+")
+    try:
+        fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        file.close()
+        return False
+
+    file.truncate(0)
+    file.write(str(os.getpid()))
+    file.flush()
+
+    pid_file = file
+    return True
+
+
+def unlock_pid() -> None:
+    """
+    Clears and unlocks the pid file if this process holds it.
+    The file itself is kept, as a successor waiting on the lock has this same file open.
+    """
+
+    global pid_file
+
+    if pid_file is None:
+        return
+
+    pid_file.truncate(0)
+    pid_file.close()
+    pid_file = None
+
+
+def save_checkpoint(state: dict) -> None:
+    """Writes the state to the checkpoint file, replacing it atomically so a reader never sees half a file."""
+
+    state = dict(state, saved_at=time.time())
+
+    tmp_file = f"{CHECKPOINT_FILE}.tmp"
+    with open(tmp_file, "w") as file:
+        json.dump(state, file)
+
+    os.replace(tmp_file, CHECKPOINT_FILE)
+
+
+def load_checkpoint(since: float = 0) -> dict:
+    """
+    Returns the state saved by the last process to shut down, or an empty dict if there is none
+    or it was saved before the since timestamp (ie. left over from an older run).
+
+    If loading was successful, the resulting dict should look like this:
+
+    {
+        "smsgs": True, # Whether scheduled messages were turned on
+        "handled_ids": [...], # Ids of the most recent push messages that were already handled
+        "saved_at": 1700000000.0
+    }
+    """
+
+    try:
+        with open(CHECKPOINT_FILE, "r") as file:
+            checkpoint = json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return dict()
+
+    if checkpoint.get("saved_at", 0) < since:
+        return dict()
+
+    return checkpoint
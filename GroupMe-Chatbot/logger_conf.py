@@ -22,22 +22,22 @@ websocket_logger = logging.getLogger("websockets.client")
 websocket_logger.addHandler(websocket_RFH)
 websocket_logger.setLevel(logging.INFO)
 
-# Notification logger
+# Message archive logger
 
-notifications_RFH = RotatingFileHandler(
-       "./Logs/notifications.log", 
+archive_RFH = RotatingFileHandler(
+       "./Logs/message_archive.log", 
        mode="a",
        maxBytes=10_000,
        backupCount=5,
        encoding='utf-8',
    )
 
-notifications_RFH.setFormatter(formatter) # Use the same formatter as the websocket_logger
+archive_RFH.setFormatter(formatter) # Use the same formatter as the websocket_logger
 
 
-notifications_logger = logging.getLogger("notifications")
-notifications_logger.setLevel(logging.DEBUG)
-notifications_logger.addHandler(notifications_RFH)
+archive_logger = logging.getLogger("message_archive")
+archive_logger.setLevel(logging.INFO)
+archive_logger.addHandler(archive_RFH)
 
 
 # Bot logger
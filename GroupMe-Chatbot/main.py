@@ -1,6 +1,9 @@
 import asyncio
+import collections
 import json
 import os
+import sys
+import time
 from sys import exit
 
 import ssl
@@ -8,7 +11,10 @@ import websockets
 
 from push_service_helpers import new_signature, poll_events
 from bot import Bot
+from message_archive import MessageArchive
+import lifecycle
 import logger_conf
+import training_schedule
 
 
 
@@ -18,9 +24,31 @@ USER_ID = os.getenv("USER_ID")
 GROUP_ID = os.getenv("GROUP_ID")
 BOT_ID = os.getenv("BOT_ID")
 
+# SQLite database all received messages are archived to
+ARCHIVE_PATH = "./Logs/message_archive.db"
 
+DRAIN_DEADLINE = 20 # Seconds given to handle already received events when shutting down
+HANDLED_IDS_KEPT = 200 # Number of recently handled message ids kept to skip duplicates after a handoff
 
-async def handle_new_data(message: str, websocket, wocc_bot, notifications_logger) -> None:
+whitelist_cache = {"mtime": None, "whitelist": {}}
+
+
+
+def load_whitelist() -> dict:
+  """Returns the admin whitelist, only reading the file again when it has been modified."""
+
+  mtime = os.path.getmtime("admin_whitelist.json")
+
+  if mtime != whitelist_cache["mtime"]:
+    with open("admin_whitelist.json", "r") as file:  
+      whitelist_cache["whitelist"] = json.load(file)
+    whitelist_cache["mtime"] = mtime
+
+  return whitelist_cache["whitelist"]
+
+
+
+async def handle_new_data(message: str, websocket, wocc_bot, archive, handled_ids) -> None:
   """Handles incoming push event data.""" 
   
   # Load the JSON data from message
@@ -53,7 +81,17 @@ async def handle_new_data(message: str, websocket, wocc_bot, notifications_logge
   except (KeyError, IndexError):
     return
 
-  notifications_logger.info(push_data[0]["data"]["alert"])
+  # Skip messages that were already handled, (ie. by the previous process during a handoff)
+  message_id = push_data[0]["data"]["subject"].get("id")
+  if message_id is not None:
+    if message_id in handled_ids:
+      return
+    handled_ids.append(message_id)
+
+  # Queue the message to be written to the message archive in the background
+  # Bot posts and commands are left out so searches don't match their own results
+  if push_data[0]["data"]["subject"].get("sender_type") != "bot" and not user_message.startswith("$"):
+    archive.archive(push_data[0]["data"]["subject"], push_data[0]["data"].get("alert"))
 
   # Check if the text message was from the valid group chat
   if user_message_group_id != wocc_bot.group_id:
@@ -68,11 +106,16 @@ async def handle_new_data(message: str, websocket, wocc_bot, notifications_logge
     wocc_bot.commands[user_message]()
     return
   
+  # Separate the arguments from admin commands that take them (ie. $search <terms>)
+  command, args = user_message, ()
+  split_message = user_message.split(maxsplit=1)
+  if split_message and split_message[0] == "$search":
+    command, args = "$search", (split_message[1] if len(split_message) > 1 else "",)
+
   # Check if the text message was an admin Bot command
-  with open("admin_whitelist.json", "r") as file:  
-    whitelist = json.load(file)
+  whitelist = load_whitelist()
 
-  if user_message in wocc_bot.admin_commands.keys() and user_id in whitelist:
+  if command in wocc_bot.admin_commands.keys() and user_id in whitelist:
     # Create coroutine for the following admin Bot command
     
     if user_message == "$smsgs on": # Names this task, so wocc_bot.smsgs_off() can cancel it
@@ -86,10 +129,10 @@ async def handle_new_data(message: str, websocket, wocc_bot, notifications_logge
       asyncio.create_task(wocc_bot.admin_commands[user_message](), name="smsgs")
       wocc_bot.post("Scheduled messages turned on") # Done outside of acutal Bot method in order to not post message when the program starts
     else:
-      wocc_bot.admin_commands[user_message]()
+      wocc_bot.admin_commands[command](*args)
     return 
   # If an admin command was called from non-admin
-  elif user_message in wocc_bot.admin_commands.keys():
+  elif command in wocc_bot.admin_commands.keys():
     wocc_bot.post("Permission denied")
     return 
 
@@ -98,22 +141,13 @@ async def handle_new_data(message: str, websocket, wocc_bot, notifications_logge
     wocc_bot.post("Unknown command")
 
 
-async def main():
-    # Initialize wocc_bot
-    wocc_bot = Bot(GM_TK, USER_ID, GROUP_ID, BOT_ID, logger_conf.bot_logger)
-    
-    # Turn on schedueld messages by default
-    asyncio.create_task(wocc_bot.admin_commands["$smsgs on"](), name="smsgs")
-
-    # Logger used to log all real GroupMe app notifications
-    notifications_logger = logger_conf.notifications_logger
 
-    # Ensure a TLS context is made for websocket connection, otherwise the program will exit with exit code 1
-    context = ssl.create_default_context()
 
-    if not isinstance(context, ssl.SSLContext):
-        logger_conf.websocket_logger.fatal("Failed to create TLS context")
-        exit(1)
+async def receive_events(context, events, subscribed) -> None:
+    """
+    Receives push events from GroupMe's push service and puts them on the events queue to be handled.
+    Sets subscribed once the first signature is able to receive push events.
+    """
 
     # Open websocket connection to GroupMe's push service
     # Uses infinite asynchronous iterator to reconnect automatically on errors 
@@ -124,17 +158,173 @@ async def main():
 
           # Poll for push events
           await poll_events(websocket)
+          subscribed.set()
 
           # Asynchronous iterations through incoming push messages 
           async for message in websocket: 
-            await handle_new_data(message, websocket, wocc_bot, notifications_logger)
+            events.put_nowait((message, websocket))
         
         except websockets.ConnectionClosed:
           logger_conf.websocket_logger.warning("Websocket Connection was unexpectedly closed")
           continue
-          
+        except asyncio.CancelledError:
+          # Close the connection right away when intake is stopped, rather than whenever the connect() iterator is cleaned up
+          await websocket.close()
+          raise
+
+
+async def drain_events(events, wocc_bot, archive, handled_ids) -> None:
+    """
+    Handles the events that were already received before shutting down, dropping the rest once DRAIN_DEADLINE has passed.
+
+    NOTE: Bot commands block while they run (ie. $schedule post), so the deadline is only checked between events
+          and a command that is already running will finish past it.
+    """
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + DRAIN_DEADLINE
+
+    while not events.empty():
+      item = events.get_nowait()
+      if item is None:
+        continue
+
+      if loop.time() > deadline:
+        logger_conf.bot_logger.warning(f"Drain deadline passed, dropping {events.qsize() + 1} unhandled events")
+        return
+
+      message, websocket = item
+      try:
+        await handle_new_data(message, websocket, wocc_bot, archive, handled_ids)
+      except websockets.ConnectionClosed:
+        # Reconnect advice can't be answered anymore since intake has stopped, the event itself is still handled
+        continue
+
+
+async def main(handoff: bool = False):
+    started_at = time.time()
+
+    # Queue of (message, websocket) push events waiting to be handled, None wakes the main loop up to shut down
+    events = asyncio.Queue()
+    stopping = asyncio.Event()
+    intake = None
+
+    def request_shutdown():
+      """Stops intake right away and wakes up the main loop so it can drain what was already received."""
+      stopping.set()
+      if intake is not None:
+        intake.cancel()
+      events.put_nowait(None)
+
+    def intake_done(task):
+      """Shuts down if intake stopped on its own, as nothing would be received anymore."""
+      if task.cancelled():
+        return
+      if task.exception() is not None:
+        logger_conf.websocket_logger.critical("Receiving push events failed", exc_info=task.exception())
+      request_shutdown()
+
+    lifecycle.install_signal_handlers(request_shutdown, logger_conf.bot_logger)
+
+    # Archive used to store and search all real GroupMe app notifications
+    archive = MessageArchive(ARCHIVE_PATH, logger_conf.archive_logger)
+    archive.start()
+
+    # Initialize wocc_bot
+    wocc_bot = Bot(GM_TK, USER_ID, GROUP_ID, BOT_ID, logger_conf.bot_logger, archive)
+
+    # Warm up what commands need so the first ones after a (re)start aren't slow
+    training_schedule.get_service()
+    try:
+      load_whitelist()
+    except (FileNotFoundError, json.JSONDecodeError):
+      logger_conf.bot_logger.warning("Failed to load admin whitelist, admin commands will not work until it is fixed")
+
+    # Ensure a TLS context is made for websocket connection, otherwise the program will exit with exit code 1
+    context = ssl.create_default_context()
+
+    if not isinstance(context, ssl.SSLContext):
+        logger_conf.websocket_logger.fatal("Failed to create TLS context")
+        exit(1)
+
+    try:
+        # Start receiving push events right away, in handoff mode they are queued until the old process has exited
+        subscribed = asyncio.Event()
+        intake = asyncio.create_task(receive_events(context, events, subscribed), name="intake")
+        intake.add_done_callback(intake_done)
+
+        checkpoint = dict()
+        if handoff:
+          # Leave the old process running if this one can't subscribe to the push service or is told to stop
+          waiters = [asyncio.create_task(subscribed.wait()), asyncio.create_task(stopping.wait())]
+          await asyncio.wait(waiters, timeout=lifecycle.HANDOFF_TIMEOUT, return_when=asyncio.FIRST_COMPLETED)
+          for waiter in waiters:
+            waiter.cancel()
+
+          if stopping.is_set():
+            logger_conf.bot_logger.critical("Shutdown requested before the old process was retired, aborting handoff")
+            intake.cancel()
+            exit(1)
+          elif not subscribed.is_set():
+            logger_conf.bot_logger.critical("Failed to subscribe to push service, aborting handoff")
+            intake.cancel()
+            exit(1)
+
+          if not await lifecycle.retire_predecessor(logger_conf.bot_logger):
+            logger_conf.bot_logger.critical("Failed to retire the old process, aborting handoff")
+            intake.cancel()
+            exit(1)
+
+          # Restore the state the old process checkpointed during its shutdown
+          checkpoint = lifecycle.load_checkpoint(since=started_at)
+
+        # Only one bot may handle the group chat, a running one has to be replaced with --handoff
+        elif not lifecycle.lock_pid():
+          logger_conf.bot_logger.critical("Another bot process is already running, start with --handoff to replace it")
+          intake.cancel()
+          exit(1)
+
+        handled_ids = collections.deque(checkpoint.get("handled_ids", []), maxlen=HANDLED_IDS_KEPT)
+
+        # Turn on scheduled messages by default, unless they were turned off before a handoff
+        if checkpoint.get("smsgs", True):
+          asyncio.create_task(wocc_bot.admin_commands["$smsgs on"](), name="smsgs")
+
+        # Handle push events until a shutdown is requested
+        while not stopping.is_set():
+          item = await events.get()
+          if item is None:
+            break
+
+          message, websocket = item
+          try:
+            await handle_new_data(message, websocket, wocc_bot, archive, handled_ids)
+          except websockets.ConnectionClosed:
+            # The intake task reconnects on its own
+            continue
+
+        logger_conf.bot_logger.info("Shutdown requested, draining received events")
+
+        # Wait for intake to finish stopping and close the websocket connection
+        await asyncio.wait([intake])
+
+        await drain_events(events, wocc_bot, archive, handled_ids)
+
+        # Checkpoint state for a successor process
+        smsgs_on = any(task.get_name() == "smsgs" and not task.done() for task in asyncio.all_tasks())
+        lifecycle.save_checkpoint({"smsgs": smsgs_on, "handled_ids": list(handled_ids)})
+        logger_conf.bot_logger.info("Checkpoint saved")
+    finally:
+        # Flush any messages still queued for the archive before exiting
+        archive.close()
+        lifecycle.unlock_pid()
+
+    # Exit with the error if intake is what stopped the bot
+    if not intake.cancelled() and intake.exception() is not None:
+        raise intake.exception()
+
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
-    exit(0)
\ No newline at end of file
+    asyncio.run(main(handoff="--handoff" in sys.argv[1:]))
+    exit(0)
@@ -0,0 +1,232 @@
+import queue
+import sqlite3
+import threading
+import time
+
+
+
+class MessageArchive:
+    """
+    Searchable archive of every push alert the bot receives, stored in SQLite with an FTS5 full text index.
+
+    Messages handed to archive() are put on a queue and written in batches by a background thread,
+    so the push event handling never has to wait on the disk.
+    """
+
+    BATCH_SIZE = 200 # Max number of messages written in one transaction
+    FLUSH_INTERVAL = 2 # Seconds the writer waits for more messages before flushing a batch
+    RETENTION_DAYS = 365 # Messages older than this are deleted from the archive
+    RETENTION_INTERVAL = 60 * 60 # Seconds between each retention cleanup
+
+
+    def __init__(self, path: str, logger: object, retention_days: int = RETENTION_DAYS):
+        """
+        Parameters:
+
+        path -> File path of the SQLite database the archive is stored in
+        logger -> Logging object used to create log messages
+        retention_days -> Number of days a message is kept inside of the archive
+        """
+
+        self.path = path
+        self.log = logger
+        self.retention_days = retention_days
+
+        self._queue = queue.Queue()
+        self._writer_thread = None
+
+        # Create the schema before any reads or writes can happen
+        conn = self._connect()
+        self._create_schema(conn)
+        conn.close()
+
+        # Connection used by search(), separate from the writer thread's connection
+        self._read_conn = self._connect()
+
+
+    def _connect(self) -> sqlite3.Connection:
+        """Returns a new connection to the archive database."""
+
+        conn = sqlite3.connect(self.path)
+
+        # WAL lets searches read while the writer thread is in the middle of a batch
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+
+        return conn
+
+
+    def _create_schema(self, conn: sqlite3.Connection) -> None:
+        """Creates the messages table, its indexes, and the FTS5 index kept in sync through triggers."""
+
+        with conn:
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS messages (
+                    id INTEGER PRIMARY KEY,
+                    message_id TEXT UNIQUE,
+                    group_id TEXT,
+                    user_id TEXT,
+                    name TEXT,
+                    text TEXT,
+                    alert TEXT,
+                    created_at INTEGER NOT NULL
+                );
+
+                CREATE INDEX IF NOT EXISTS messages_group_time ON messages (group_id, created_at);
+                CREATE INDEX IF NOT EXISTS messages_user_time ON messages (user_id, created_at);
+                CREATE INDEX IF NOT EXISTS messages_time ON messages (created_at);
+
+                CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5 (
+                    name, text, content='messages', content_rowid='id'
+                );
+
+                CREATE TRIGGER IF NOT EXISTS messages_ai AFTER INSERT ON messages BEGIN
+                    INSERT INTO messages_fts (rowid, name, text) VALUES (new.id, new.name, new.text);
+                END;
+
+                CREATE TRIGGER IF NOT EXISTS messages_ad AFTER DELETE ON messages BEGIN
+                    INSERT INTO messages_fts (messages_fts, rowid, name, text) VALUES ('delete', old.id, old.name, old.text);
+                END;
+                """
+            )
+
+
+    def start(self) -> None:
+        """Starts the background thread that writes queued messages to the archive."""
+
+        if self._writer_thread is not None and self._writer_thread.is_alive():
+            return
+
+        self._writer_thread = threading.Thread(target=self._writer, name="message_archive", daemon=True)
+        self._writer_thread.start()
+        self.log.info("Message archive writer started")
+
+
+    def close(self, timeout: float = None) -> None:
+        """Flushes all queued messages to the archive and stops the writer thread."""
+
+        if self._writer_thread is not None:
+            # None is the sentinel telling the writer thread to exit after its last batch
+            self._queue.put(None)
+            self._writer_thread.join(timeout)
+            self._writer_thread = None
+
+        self._read_conn.close()
+        self.log.info("Message archive closed")
+
+
+    def archive(self, subject: dict, alert: str) -> None:
+        """Queues the subject of a push event to be written to the archive. Never blocks."""
+
+        row = (
+            subject.get("id"),
+            subject.get("group_id"),
+            subject.get("user_id"),
+            subject.get("name"),
+            subject.get("text"),
+            alert,
+            int(subject.get("created_at") or time.time()),
+        )
+
+        self._queue.put_nowait(row)
+
+
+    def search(self, terms: str, group_id: str = None, limit: int = 10) -> list:
+        """
+        Returns a list of the most recent archived messages matching all of the given terms.
+
+        Each message in the list is a tuple of: (name, text, created_at)
+        """
+
+        # Quote each term so characters like - or * are not read as FTS5 query syntax
+        query = " ".join('"' + term.replace('"', '""') + '"' for term in terms.split())
+        if not query:
+            return []
+
+        sql = (
+            "SELECT m.name, m.text, m.created_at FROM messages_fts "
+            "JOIN messages m ON m.id = messages_fts.rowid "
+            "WHERE messages_fts MATCH ?"
+        )
+        params = [query]
+
+        if group_id is not None:
+            sql += " AND m.group_id = ?"
+            params.append(group_id)
+
+        sql += " ORDER BY m.created_at DESC LIMIT ?"
+        params.append(limit)
+
+        return self._read_conn.execute(sql, params).fetchall()
+
+
+    def _writer(self) -> None:
+        """Writer thread loop: takes messages off the queue and writes them in batches until the sentinel is received."""
+
+        conn = self._connect()
+        last_retention = 0
+        running = True
+
+        while running:
+            batch = []
+
+            # Block until at least one message arrives, or flush interval passes to allow retention to run
+            try:
+                item = self._queue.get(timeout=self.FLUSH_INTERVAL)
+            except queue.Empty:
+                item = ()
+
+            # Drain whatever else is already waiting, up to the batch size
+            while item is not None:
+                if item:
+                    batch.append(item)
+                if len(batch) >= self.BATCH_SIZE:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+
+            if item is None:
+                running = False
+
+            if batch:
+                self._write_batch(conn, batch)
+
+            if time.time() - last_retention > self.RETENTION_INTERVAL:
+                self._apply_retention(conn)
+                last_retention = time.time()
+
+        conn.close()
+
+
+    def _write_batch(self, conn: sqlite3.Connection, batch: list) -> None:
+        """Writes a batch of messages to the archive inside of a single transaction."""
+
+        try:
+            with conn:
+                conn.executemany(
+                    "INSERT OR IGNORE INTO messages "
+                    "(message_id, group_id, user_id, name, text, alert, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    batch,
+                )
+        except sqlite3.Error:
+            self.log.exception(f"Failed to write batch of {len(batch)} messages to the archive")
+
+
+    def _apply_retention(self, conn: sqlite3.Connection) -> None:
+        """Deletes all messages older than the retention policy from the archive."""
+
+        cutoff = int(time.time()) - self.retention_days * 24 * 60 * 60
+
+        try:
+            with conn:
+                deleted = conn.execute("DELETE FROM messages WHERE created_at < ?", (cutoff,)).rowcount
+        except sqlite3.Error:
+            self.log.exception("Failed to apply retention policy to the archive")
+            return
+
+        if deleted:
+            self.log.info(f"Retention policy removed {deleted} messages from the archive")
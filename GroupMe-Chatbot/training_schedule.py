@@ -18,6 +18,19 @@ creds = service_account.Credentials.from_service_account_file(
 
 SPREADSHEET_ID = os.getenv("SPREADSHEET_ID")
 
+service = None # Cached Sheets API service, built once by get_service()
+
+
+def get_service():
+    """Returns the Google Sheets API service, building it on the first call so later commands don't pay for it."""
+    global service
+
+    if service is None:
+        service = build("sheets", "v4", credentials=creds)
+        bot_logger.info("Built Google Sheets API service")
+
+    return service
+
 
 def gather_data() -> dict:
     """
@@ -44,8 +57,7 @@ def gather_data() -> dict:
     data = dict()
 
     try:
-        service = build("sheets", "v4", credentials=creds)
-        sheet = service.spreadsheets()
+        sheet = get_service().spreadsheets()
         
         # Call the Sheets API
         result = sheet.values().batchGet(spreadsheetId=SPREADSHEET_ID,
@@ -64,8 +76,7 @@ def gather_data() -> dict:
 def clear() -> None:
     """Calls the google sheets API and clears all training schedule data within the training google sheet."""
     try:
-        service = build("sheets", "v4", credentials=creds)
-        sheet = service.spreadsheets()
+        sheet = get_service().spreadsheets()
 
         
         batch_clear_values_request_body = {